@@ -1,27 +1,35 @@
-import json
-from pathlib import Path
+import os
+import sys
 from typing import Dict, List, Optional
 
+import orjson
+
 TAGS = {
     'think': 'collapse',
     'meta': 'metadata'
 }
 
+_OPEN = {type_: f'<{tag}>' for type_, tag in TAGS.items()}
+_CLOSE = {type_: f'</{tag}>' for type_, tag in TAGS.items()}
+
 
 class File:
     def __init__(self, path: str, repo_path: str):
         self.path: str = path
-        self._fs_path = Path(f'{repo_path}/{path}')
+        self._fs_path: str = f'{repo_path}/{path}'
+        self._content: Optional[str] = None
 
     def suffix(self) -> str:
-        return self._fs_path.suffix
+        return os.path.splitext(self.path)[1]
 
     def exists(self) -> bool:
-        return self._fs_path.is_file()
+        return os.path.isfile(self._fs_path)
 
     def get_content(self) -> str:
-        with open(self._fs_path, 'r') as f:
-            return f.read()
+        if self._content is None:
+            with open(self._fs_path, 'rb', buffering=0) as f:
+                self._content = f.read().decode('utf-8')
+        return self._content
 
 
 class Message:
@@ -45,7 +53,7 @@ class ExtensionAPI:
             clip_board: Current clipboard content (if any)
             cursor_row: Current cursor row position
             cursor_column: Current cursor column position
-            chat_history: List of previous chat messages
+            chat_history: List of previous chat messages as `role`/`content` dicts
             prompt: Current user prompt
             api_key: API key for LLM services
     """
@@ -59,13 +67,15 @@ class ExtensionAPI:
     clip_board: Optional[str]
     cursor_row: int
     cursor_column: int
-    chat_history: List[Message]
+    chat_history: List[Dict[str, str]]
     terminal_history: Optional[str]
     terminal_snapshot: Optional[List[str]]
     prompt: str
     api_key: str
     api_url: str
 
+    _repo_paths: List[str]
+    _repo_files: Optional[List[File]]
     _blocks: List[str]
 
     def load(self, **kwargs):
@@ -82,20 +92,30 @@ class ExtensionAPI:
         self.current_file = File(kwargs['current_file'], self.repo_path)
         self.edit_file = File(kwargs['edit_file'], self.repo_path) if 'edit_file' in kwargs else None
 
-        self.repo_files = [File(p, self.repo_path) for p in kwargs['repo']]
+        self._repo_paths = kwargs['repo']
+        self._repo_files = None
         self.opened_files = [File(p, self.repo_path) for p in kwargs['opened_files']]
 
-        self.chat_history = [Message(**m) for m in kwargs['chat_history']]
+        self.chat_history = kwargs['chat_history']
 
         self._blocks = []
 
         return self
 
+    @property
+    def repo_files(self) -> List[File]:
+        """Files in the repository, built on access since most extensions never look at them."""
+        if self._repo_files is None:
+            self._repo_files = [File(p, self.repo_path) for p in self._repo_paths]
+        return self._repo_files
+
     def _dump(self, method: str, **kwargs):
         assert 'method' not in kwargs
         kwargs['method'] = method
 
-        print(json.dumps(kwargs), flush=True)
+        out = sys.stdout.buffer
+        out.write(orjson.dumps(kwargs, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY))
+        out.flush()
 
     def push_to_chat(self, content: str):
         """Send content to be displayed in the chat UI."""
@@ -104,10 +124,8 @@ class ExtensionAPI:
     def start_block(self, type_: str):
         """Start a block of type `type`. `type_` can be `meta` or `think`."""
 
-        tag = TAGS[type_]
-
-        self.push_to_chat(f"<{tag}>")
-        self._blocks.append(tag)
+        self.push_to_chat(_OPEN[type_])
+        self._blocks.append(_CLOSE[type_])
 
     def end_block(self):
         """
@@ -115,25 +133,19 @@ class ExtensionAPI:
         """
         assert len(self._blocks) > 0
 
-        tag = self._blocks.pop(-1)
-
-        self.push_to_chat(f'</{tag}>')
+        self.push_to_chat(self._blocks.pop(-1))
 
     def push_block(self, type_: str, content: str):
         """
         Send a block of type `type`. `type_` can be `meta` or `think`
         """
-        self.start_block(type_)
-        self.push_to_chat(content)
-        self.end_block()
+        self.push_to_chat(_OPEN[type_] + content + _CLOSE[type_])
 
     def push_meta(self, content: str):
         """
         Send a meta block.
         """
-        self.start_block('meta')
-        self.push_to_chat(content)
-        self.end_block()
+        self.push_block('meta', content)
 
     def apply_diff(self, patch: List[str], matches: List[List[int]]):
         """
@@ -142,7 +154,8 @@ class ExtensionAPI:
         Args:
             patch: Lines of code in the patch to apply
             matches: list of [row_in_a, row_in_b] pairs returned by
-                     extensions.extension_api.diff_lines.get_matches
+                     extensions.extension_api.diff_lines.get_matches,
+                     or an equivalent `(n, 2)` integer numpy array
         """
         self._dump('apply_diff', patch=patch, matches=matches)
 
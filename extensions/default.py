@@ -1,10 +1,16 @@
-from typing import Dict, List
+import functools
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 
 from openai import OpenAI
 
-from common.api import ExtensionAPI
+from common.api import ExtensionAPI, File
 
 
+@functools.lru_cache(maxsize=4)
 def get_system_prompt(model: str):
     system_prompt = f"""
 You are an intelligent programmer, powered by {model}. You are happy to help answer any questions that the user has (usually they will be about coding).
@@ -47,42 +53,79 @@ function AIChatHistory() {{
     return system_prompt
 
 
-def _format_code_block(content: str) -> str:
-    return f"```\n{content}\n```"
+def _format_code_block(content: str) -> Tuple[str, ...]:
+    return "```\n", content, "\n```"
 
 
-def _format_section(title: str, content: str) -> str:
-    return f"## {title}\n\n{content}"
+def _format_section(title: str, *content: str) -> Tuple[str, ...]:
+    return (f"## {title}\n\n", *content)
 
 
 def build_context(api: ExtensionAPI) -> str:
     """Builds the context string from the current file and selection."""
     
-    context = []
+    buf = io.StringIO()
+    paths: List[str] = []
 
     if api.opened_files:
-        opened_files = [f'Path: `{f.path}`\n\n' + _format_code_block(f.get_content()) for f in api.opened_files]
-
-        context.append(_format_section("Other relevant files", "\n\n".join(opened_files)))
+        if len(api.opened_files) > 1:
+            with ThreadPoolExecutor(max_workers=min(8, len(api.opened_files))) as ex:
+                contents = list(ex.map(File.get_content, api.opened_files))
+        else:
+            contents = [f.get_content() for f in api.opened_files]
+
+        buf.writelines(_format_section("Other relevant files"))
+        for i, (f, content) in enumerate(zip(api.opened_files, contents)):
+            if i > 0:
+                buf.write("\n\n")
+            buf.writelines(("Path: `", f.path, "`\n\n", *_format_code_block(content)))
+            paths.append(f.path)
+        buf.write("\n\n")
         
-    api.push_to_chat(content=f"\n<metadata> Opened Files: {[f.path for f in api.opened_files]} </metadata>\n")
+    api.push_to_chat(content=f"\n<metadata> Opened Files: {paths} </metadata>\n")
 
-    context.append(
+    buf.writelines(
         _format_section("Current File",
-                        f"Here is the file I'm looking at (`{api.current_file.path}`):\n\n" +
-                        _format_code_block(api.current_file_content))
+                        "Here is the file I'm looking at (`", api.current_file.path, "`):\n\n",
+                        *_format_code_block(api.current_file_content))
     )
     
     api.push_to_chat(content=f"\n<metadata> Current File: {api.current_file.path} </metadata>\n")
 
     if api.selection and api.selection.strip():
-        context.append(
+        buf.write("\n\n")
+        buf.writelines(
             _format_section("Selection",
-                            "This is the code snippet that I'm referring to\n\n" +
-                            _format_code_block(api.selection))
+                            "This is the code snippet that I'm referring to\n\n",
+                            *_format_code_block(api.selection))
         )
 
-    return "\n\n".join(context)
+    return buf.getvalue()
+
+class _StreamBuffer:
+    """Coalesces streamed deltas so they are sent to the chat UI in fewer `push_to_chat` calls."""
+
+    def __init__(self, api: ExtensionAPI, max_size: int = 16384, max_delay: float = 0.02):
+        self.api = api
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._parts: List[str] = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    def push(self, content: str):
+        self._parts.append(content)
+        self._size += len(content)
+        if self._size >= self.max_size or time.monotonic() - self._last_flush > self.max_delay:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.api.push_to_chat(content="".join(self._parts))
+            self._parts = []
+            self._size = 0
+        self._last_flush = time.monotonic()
+
 
 def call_llm(api: ExtensionAPI, model: str, messages: List[Dict[str, str]]):
     """Streams responses from the LLM and sends them to the chat UI in real-time."""
@@ -102,26 +145,30 @@ def call_llm(api: ExtensionAPI, model: str, messages: List[Dict[str, str]]):
     },
     )
     
+    buffer = _StreamBuffer(api)
     thinking = False
-    for chunk in stream:
-        delta = chunk.choices[0].delta
-        if getattr(delta, 'reasoning', None):
-            if not thinking:
-                api.push_to_chat(content="<collapse>")
-                thinking = True
-            api.push_to_chat(content=delta.reasoning)
+    try:
+        for chunk in stream:
+            delta = chunk.choices[0].delta
+            if getattr(delta, 'reasoning', None):
+                if not thinking:
+                    buffer.push("<collapse>")
+                    thinking = True
+                buffer.push(delta.reasoning)
         
-        if delta.content:
-            if thinking:
-                api.push_to_chat(content="</collapse>")
-                thinking = False
-            api.push_to_chat(content=delta.content)
+            if delta.content:
+                if thinking:
+                    buffer.push("</collapse>")
+                    thinking = False
+                buffer.push(delta.content)
             
-        if chunk.usage is not None:    
-             prompt_tokens = chunk.usage.prompt_tokens
-             api.push_to_chat(content=f"\n<metadata> number of tokens used in prompt: {prompt_tokens} model: {model} </metadata>\n")
-
-    api.terminate_chat()
+            if chunk.usage is not None:    
+                 prompt_tokens = chunk.usage.prompt_tokens
+                 buffer.flush()
+                 api.push_to_chat(content=f"\n<metadata> number of tokens used in prompt: {prompt_tokens} model: {model} </metadata>\n")
+    finally:
+        buffer.flush()
+        api.terminate_chat()
 
 
 def extension(api: ExtensionAPI):
@@ -140,20 +187,21 @@ def extension(api: ExtensionAPI):
         prompt = prompt[1:].strip()
         messages = [
             {'role': 'system', 'content': get_system_prompt(model)},
-            *[m.to_dict() for m in api.chat_history],
+            *api.chat_history,
             {'role': 'user', 'content': api.prompt},
         ]
     else:
         messages = [
             {'role': 'system', 'content': get_system_prompt(model)},
             {'role': 'user', 'content': context},
-            *[m.to_dict() for m in api.chat_history],
+            *api.chat_history,
             {'role': 'user', 'content': api.prompt},
         ]
 
     api.log(f'messages {len(messages)}')
     api.log(f'prompt {api.prompt}')
-    terminal_snapshot = "\n".join(api.terminal_snapshot)
-    api.log(f'## Terminal {terminal_snapshot}')
+    if api.terminal_snapshot and os.environ.get('EXT_DEBUG'):
+        terminal_snapshot = "\n".join(api.terminal_snapshot)
+        api.log(f'## Terminal {terminal_snapshot}')
 
     call_llm(api, model, messages)
\ No newline at end of file